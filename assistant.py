@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from form_schema import FORM_SECTIONS
+from llm_helper import DEFAULT_MODEL, NUM_CTX, REASONING_MODEL, ask_ollama
+
+# References up to this size are sent whole, so the prompt prefix is identical
+# for every section and question on the same document.
+PREFIX_BUDGET_CHARS = int(os.environ.get("INTAKE_PREFIX_BUDGET_CHARS", "12000"))
+
+# Upper bound on concurrent generations; match Ollama's OLLAMA_NUM_PARALLEL.
+DRAFT_CONCURRENCY = int(os.environ.get("INTAKE_DRAFT_CONCURRENCY", "4"))
+
+DRAFT_QUESTION = "Draft concise notes for this section of the intake form based on the reference document."
+
+# Generation profiles: the model and Ollama options used for each kind of request.
+PROFILES = {
+    # Short factual questions, e.g. which file types or formats to pick.
+    "lookup": {"model": DEFAULT_MODEL, "num_predict": 192, "num_ctx": NUM_CTX, "temperature": 0.1},
+    "explain": {"model": DEFAULT_MODEL, "num_predict": 512, "num_ctx": NUM_CTX, "temperature": 0.3},
+    "draft": {"model": DEFAULT_MODEL, "num_predict": 768, "num_ctx": NUM_CTX, "temperature": 0.3},
+    # Escalation on demand; leaves room for the model's reasoning tokens.
+    "reasoning": {"model": REASONING_MODEL, "num_predict": 4096, "num_ctx": NUM_CTX, "temperature": 0.6},
+}
+
+# Questions up to this many words are answered with the "lookup" profile.
+LOOKUP_MAX_WORDS = int(os.environ.get("INTAKE_LOOKUP_MAX_WORDS", "6"))
+
+SECTION_TOPICS = {spec["name"]: spec["topic"] for spec in FORM_SECTIONS}
+SECTIONS = list(SECTION_TOPICS)
+SECTION_PROFILES = {spec["name"]: spec.get("profile", "explain") for spec in FORM_SECTIONS}
+
+def is_error(reply):
+    return reply.startswith("❌")
+
+def choose_profile(section, question, escalate=False):
+    """
+    Returns the name of the generation profile for a question: "reasoning"
+    when escalated, "lookup" for short questions, otherwise the section's own.
+    An empty question asks about the section as a whole, so it gets the
+    section's profile too.
+    """
+    if escalate:
+        return "reasoning"
+    if 0 < len(question.split()) <= LOOKUP_MAX_WORDS:
+        return "lookup"
+    return SECTION_PROFILES[section]
+
+def profile_request(name):
+    """
+    Returns (model, options) for a generation profile.
+    """
+    profile = PROFILES[name]
+    return profile["model"], {k: v for k, v in profile.items() if k != "model"}
+
+def section_context(index, section, question, k=4):
+    """
+    Returns the top-k reference chunks for this section and question.
+    """
+    if index is None:
+        return []
+    return index.search(f"{SECTION_TOPICS[section]} {question}", k)
+
+def build_prompt(section, question, index, k=4):
+    """
+    Returns (system_prompt, prompt) for a section question. The system prompt
+    holds the reference material and depends only on the document (or, for
+    long documents, on the document and section), so Ollama can reuse its
+    prefill across follow-up questions. The section name, any extra chunks
+    matched by the question, and the question itself follow in the prompt.
+    """
+    if index is None:
+        reference, extra = [], []
+    elif sum(len(chunk) for chunk in index.chunks) <= PREFIX_BUDGET_CHARS:
+        reference, extra = index.chunks, []
+    else:
+        reference = section_context(index, section, "", k)
+        extra = [chunk for chunk in section_context(index, section, question, k) if chunk not in reference]
+
+    system_prompt = "You are helping a user complete a healthcare app intake form."
+    if reference:
+        system_prompt += "\n\nReference:\n" + "\n\n---\n\n".join(reference)
+
+    prompt = f"Section: '{section}'"
+    if extra:
+        prompt += "\n\nAdditional reference:\n" + "\n\n---\n\n".join(extra)
+    prompt += f"\n\nUser question: {question}"
+    return system_prompt, prompt
+
+def draft_sections(index, sections=SECTIONS, max_workers=DRAFT_CONCURRENCY):
+    """
+    Drafts notes for each section concurrently, at most `max_workers` at a
+    time, and yields (section, reply) pairs as each one completes. A failure
+    in one section is reported as its reply and does not affect the others.
+    """
+    model, options = profile_request("draft")
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        for section in sections:
+            system_prompt, prompt = build_prompt(section, DRAFT_QUESTION, index)
+            futures[pool.submit(ask_ollama, prompt, model, system_prompt, options=options)] = section
+        for future in as_completed(futures):
+            try:
+                reply = future.result()
+            except Exception as e:
+                reply = f"❌ Error drafting section: {e}"
+            yield futures[future], reply
+    finally:
+        # Don't hold up a Streamlit rerun that abandons the generator midway.
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,158 @@
+"""
+Headless batch intake: drafts the assistant notes for many reference documents
+and writes one Markdown intake form per input, without the Streamlit UI.
+
+    python batch_intake.py specs/ out/                 # a directory of .md files
+    python batch_intake.py intakes.jsonl out/          # partially filled forms
+
+Each JSONL line is {"id": ..., "form_data": {...}, "ref_doc": "..."} where
+"ref_path" may be given instead of "ref_doc"; "id" is required. Completed inputs are recorded in
+<output>/.checkpoint.jsonl and skipped when the command is re-run.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from assistant import DRAFT_CONCURRENCY, SECTIONS, draft_sections, is_error
+from form_export import to_markdown
+from form_schema import FORM_SECTIONS, default_value
+from llm_helper import prewarm
+from retrieval import build_index
+
+CHECKPOINT_NAME = ".checkpoint.jsonl"
+
+def safe_job_id(raw):
+    """
+    Turns an input ID into a file name that stays inside the output directory.
+    """
+    job_id = re.sub(r"[^A-Za-z0-9._-]+", "_", Path(str(raw)).name).strip("._")
+    if not job_id:
+        raise ValueError(f"Unusable id {raw!r}")
+    return job_id
+
+def load_jobs(source):
+    """
+    Yields (job_id, ref_doc, form_data) for each input in `source`.
+    """
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(source.glob("*.md")):
+            yield path.stem, path.read_text(encoding="utf-8"), {}
+        return
+
+    with open(source, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "id" not in record:
+                # A positional fallback would make the checkpoint skip the wrong records.
+                raise ValueError(f"{source}:{line_no} has no id")
+            ref_doc = record.get("ref_doc")
+            if ref_doc is None and record.get("ref_path"):
+                ref_doc = (source.parent / record["ref_path"]).read_text(encoding="utf-8")
+            yield safe_job_id(record["id"]), ref_doc or "", record.get("form_data", {})
+
+def load_checkpoint(path):
+    if not path.exists():
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {json.loads(line)["id"] for line in f if line.strip()}
+
+def process_job(job_id, ref_doc, form_data, output_dir, section_workers):
+    """
+    Drafts every section that has no `llm_note` yet and writes <job_id>.md.
+    Returns (drafted_count, failed_sections, seconds).
+    """
+    started = time.monotonic()
+    index = build_index(ref_doc) if ref_doc else None
+    # Start from an untouched form, as the UI does, so the output lists every field.
+    for spec in FORM_SECTIONS:
+        fields = {field["key"]: default_value(field) for field in spec["fields"]}
+        fields.update(form_data.get(spec["name"], {}))
+        form_data[spec["name"]] = fields
+    pending = [section for section in SECTIONS if not form_data[section].get("llm_note")]
+
+    drafted, failed = 0, []
+    for section, reply in draft_sections(index, pending, max_workers=section_workers):
+        if is_error(reply):
+            failed.append(section)
+            continue
+        form_data[section]["llm_note"] = reply
+        drafted += 1
+
+    (output_dir / f"{job_id}.md").write_text(to_markdown(form_data), encoding="utf-8")
+    return drafted, failed, time.monotonic() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draft intake forms for many reference documents.")
+    parser.add_argument("source", help="directory of .md reference files, or a .jsonl of form_data records")
+    parser.add_argument("output", help="directory for the generated Markdown files")
+    parser.add_argument("--workers", type=int, default=2, help="documents processed concurrently (default: 2)")
+    parser.add_argument("--section-workers", type=int, default=DRAFT_CONCURRENCY,
+                        help=f"concurrent section prompts per document (default: {DRAFT_CONCURRENCY})")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and process every input")
+    args = parser.parse_args(argv)
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = output_dir / CHECKPOINT_NAME
+    if args.restart and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    completed = load_checkpoint(checkpoint_path)
+
+    try:
+        all_jobs = list(load_jobs(args.source))
+    except ValueError as e:
+        parser.error(str(e))
+    seen = set()
+    for job_id, _, _ in all_jobs:
+        if job_id in seen:
+            parser.error(f"Duplicate id {job_id!r} in {args.source}")
+        seen.add(job_id)
+    jobs = [job for job in all_jobs if job[0] not in completed]
+    skipped = len(completed)
+    print(f"{len(jobs)} to process, {skipped} already done")
+    if jobs:
+        prewarm()
+
+    started = time.monotonic()
+    done, failed_jobs, sections_drafted = 0, 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        futures = {
+            pool.submit(process_job, job_id, ref_doc, form_data, output_dir, args.section_workers): job_id
+            for job_id, ref_doc, form_data in jobs
+        }
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                drafted, failed, seconds = future.result()
+            except Exception as e:
+                failed_jobs += 1
+                print(f"❌ {job_id}: {e}", file=sys.stderr)
+                continue
+            sections_drafted += drafted
+            if failed:
+                # Left out of the checkpoint so the next run retries it.
+                failed_jobs += 1
+                print(f"⚠️ {job_id}: {len(failed)} section(s) failed: {', '.join(failed)}", file=sys.stderr)
+                continue
+            done += 1
+            checkpoint.write(json.dumps({"id": job_id, "sections": drafted, "seconds": round(seconds, 2)}) + "\n")
+            checkpoint.flush()
+            print(f"✅ {job_id} ({drafted} sections, {seconds:.1f}s)")
+
+    elapsed = time.monotonic() - started
+    per_minute = 60 / elapsed if elapsed else 0
+    print(
+        f"\nProcessed {done} intake(s), {failed_jobs} failed, {skipped} skipped in {elapsed:.1f}s "
+        f"({done * per_minute:.1f} intakes/min, {sections_drafted * per_minute:.1f} sections/min)"
+    )
+    return 1 if failed_jobs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks that need no GPU or
+network. Serves /api/chat and /api/generate (streaming and non-streaming),
+/api/tags and /api/ps, with a configurable time-to-first-token and token rate.
+Models with "r1" in their name open each answer with a <think> block, and
+options.num_predict caps the tokens generated.
+
+    python bench/fake_ollama.py --port 11434 --latency 0.5 --token-rate 40
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("The", " reference", " document", " describes", " this", " section", " in", " detail", ".")
+THINKING = ("<th", "ink>", "Let", " me", " look", " at", " the", " reference", ".", "</think>", "\n\n")
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    token_rate = 50.0
+    tokens = 40
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3.2:3b"}, {"name": "deepseek-r1:latest"}]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": name} for name in sorted(self.server.loaded_models)]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        chat = self.path == "/api/chat"
+        self.server.loaded_models.add(request.get("model"))
+        if chat:
+            prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        else:
+            prompt_chars = len(request.get("prompt", "")) + len(request.get("system", ""))
+        # A request with nothing to generate only loads the model (pre-warming).
+        thinking = THINKING if "r1" in request.get("model", "") else ()
+        words = thinking + WORDS * self.tokens
+        tokens = len(thinking) + self.tokens if prompt_chars else 0
+        num_predict = request.get("options", {}).get("num_predict", -1)
+        done_reason = "stop"
+        if 0 <= num_predict < tokens:
+            tokens, done_reason = num_predict, "length"
+
+        def piece(text, done=False):
+            body = {"model": request.get("model"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+            if chat:
+                body["message"] = {"role": "assistant", "content": text}
+            else:
+                body["response"] = text
+            return body
+
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        prefill_ns = int((time.perf_counter() - started) * 1e9)
+        stats = {
+            "prompt_eval_count": prompt_chars // 4,
+            "prompt_eval_duration": prefill_ns,
+            "eval_count": tokens,
+            "eval_duration": int(tokens / self.token_rate * 1e9),
+            "load_duration": 0,
+        }
+
+        if not request.get("stream", True):
+            time.sleep(tokens / self.token_rate)
+            final = piece("".join(words[:tokens]), done=True)
+            final.update(stats, done_reason=done_reason, total_duration=int((time.perf_counter() - started) * 1e9))
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(body):
+            line = (json.dumps(body) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+        for i in range(tokens):
+            write(piece(words[i]))
+            time.sleep(1 / self.token_rate)
+        final = piece("", done=True)
+        final.update(stats, done_reason=done_reason, total_duration=int((time.perf_counter() - started) * 1e9))
+        write(final)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded_models = set()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections is expected; stay quiet.
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+def start_server(port=0, latency=0.2, token_rate=50.0, tokens=40):
+    """
+    Starts the fake server on a background thread and returns (server, base_url).
+    Pass port=0 to pick a free port.
+    """
+    handler = type("Handler", (FakeOllamaHandler,), {"latency": latency, "token_rate": token_rate, "tokens": tokens})
+    server = FakeOllamaServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token (default: 0.2)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens generated per second (default: 50)")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer (default: 40)")
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, args.latency, args.token_rate, args.tokens)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Headless load test for main.py. Simulates concurrent sessions with
+Streamlit's AppTest: each session fills every section and asks the assistant
+a few questions, against the bundled fake Ollama server. Reports p50/p95
+rerun and assistant latency plus memory per session, and writes the results
+as JSON so releases can be compared.
+
+By default (--mode shared) every session runs on a thread of this process,
+so they share the job queue, response cache and reference store as real
+sessions do. AppTest cannot run scripts concurrently, so reruns are taken
+one at a time while generations still overlap. --mode processes runs each
+session in its own process instead: reruns overlap, but no process-wide
+state is shared. The report lists the limitations of the mode used.
+
+    python bench/load_test.py --sessions 8 --output bench_results.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_ollama import start_server  # noqa: E402
+
+LIMITATIONS = {
+    "shared": [
+        "AppTest cannot run scripts concurrently, so reruns are serialised; "
+        "rerun latency excludes the wait for other sessions' reruns.",
+        "Memory per session is the process's RSS growth divided by the number of sessions.",
+    ],
+    "processes": [
+        "Each session runs in its own process, so the job queue, response cache "
+        "and reference store are not shared: queue fairness, coalescing and "
+        "admission control are not exercised across sessions.",
+    ],
+}
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def summarise(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 1) if values else None,
+        "max_ms": round(max(values) * 1000, 1) if values else None,
+    }
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is a high-water mark in KiB on Linux, bytes on macOS.
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def warm_up(timeout):
+    """
+    Runs the app once, unmeasured, so imports and caches are warm before any
+    session is timed.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    AppTest.from_file(str(ROOT / "main.py"), default_timeout=timeout).run()
+
+def run_session(session_no, timeout, run_lock=None):
+    """
+    Runs one simulated session and returns its timings and memory. In a
+    session process (no `run_lock`) the process is warmed up first; threads
+    sharing a process pass a lock that serialises their AppTest runs.
+    """
+    from form_schema import FORM_SECTIONS
+    from streamlit.testing.v1 import AppTest
+
+    if run_lock is None:
+        warm_up(timeout)
+        run_lock = contextlib.nullcontext()
+    baseline_rss = rss_bytes()
+    rerun_times, assistant_times = [], []
+
+    def timed_run(at):
+        with run_lock:
+            started = time.perf_counter()
+            at.run(timeout=timeout)
+            rerun_times.append(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    with run_lock:
+        at = AppTest.from_file(str(ROOT / "main.py"), default_timeout=timeout)
+    timed_run(at)
+    for n, spec in enumerate(FORM_SECTIONS, start=1):
+        section = spec["name"]
+        for field in spec["fields"]:
+            if field["widget"] == "text_area":
+                at.text_area(key=f"{section}_{field['key']}").input(f"Session {session_no} value for {field['label']}")
+                timed_run(at)
+                break
+
+        # Only a handful of sections per session use the assistant, as in practice.
+        if n % 4 == 1:
+            ask = next(b for b in at.button if b.label == f"💡 Ask Assistant ({section})")
+            ask.click()
+            timed_run(at)
+            # Unique questions so the response cache does not short-circuit the call.
+            at.text_area(key=f"q_{n}").input(f"Session {session_no}: what belongs in {section}? {time.time_ns()}")
+            timed_run(at)
+            at.button(key=f"a_{n}").click()
+            started = time.perf_counter()
+            timed_run(at)
+            # The answer is polled by a fragment; AppTest has to rerun to pick it up.
+            while f"llm_response_{n}" not in at.session_state:
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"no answer for section {n} after {timeout}s")
+                time.sleep(0.05)
+                timed_run(at)
+            assistant_times.append(time.perf_counter() - started)
+
+    return {"reruns": rerun_times, "assistant": assistant_times, "memory_bytes": rss_bytes() - baseline_rss}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the intake app with simulated sessions.")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions (default: 4)")
+    parser.add_argument("--mode", choices=("shared", "processes"), default="shared",
+                        help="run sessions as threads sharing one app process, or one process each (default: shared)")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake Ollama time-to-first-token in seconds")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake Ollama tokens per second")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per fake answer")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout in seconds")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    server, url = start_server(0, args.latency, args.token_rate, args.tokens)
+    scratch = tempfile.mkdtemp(prefix="intake-bench-")
+    # Read by the app modules on import, here or in the session processes.
+    os.environ["OLLAMA_HOSTS"] = url
+    os.environ["INTAKE_CACHE_PATH"] = os.path.join(scratch, "llm_responses.sqlite3")
+    os.environ["INTAKE_SESSION_DB"] = os.path.join(scratch, "sessions.sqlite3")
+    os.environ["INTAKE_REFDOC_DIR"] = os.path.join(scratch, "refdocs")
+    output = Path(args.output).resolve()
+    os.chdir(ROOT)
+
+    if args.mode == "shared":
+        warm_up(args.timeout)
+        baseline_rss = rss_bytes()
+        run_lock = threading.Lock()
+        pool = ThreadPoolExecutor(max_workers=args.sessions)
+    else:
+        run_lock = None
+        pool = ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context("spawn"))
+
+    results, errors = [], []
+    started = time.perf_counter()
+    with pool:
+        futures = {pool.submit(run_session, i, args.timeout, run_lock): i for i in range(args.sessions)}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(f"session {futures[future]}: {e}")
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    if args.mode == "shared":
+        memory_per_session = (rss_bytes() - baseline_rss) / len(results) if results else 0
+    else:
+        memory = [r["memory_bytes"] for r in results]
+        memory_per_session = sum(memory) / len(memory) if memory else 0
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    import streamlit
+
+    report = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "config": vars(args),
+        "limitations": LIMITATIONS[args.mode],
+        "sessions_completed": len(results),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "rerun_latency": summarise([t for r in results for t in r["reruns"]]),
+        "assistant_latency": summarise([t for r in results for t in r["assistant"]]),
+        "memory_per_session_bytes": int(memory_per_session),
+    }
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    print(f"{report['sessions_completed']}/{args.sessions} sessions in {report['elapsed_s']}s")
+    print(f"rerun latency     p50 {report['rerun_latency']['p50_ms']} ms, p95 {report['rerun_latency']['p95_ms']} ms")
+    print(f"assistant latency p50 {report['assistant_latency']['p50_ms']} ms, p95 {report['assistant_latency']['p95_ms']} ms")
+    print(f"memory / session  {memory_per_session / 1024 / 1024:.1f} MiB")
+    for error in errors:
+        print(f"❌ {error}", file=sys.stderr)
+    print(f"Results written to {output}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import hashlib
+import io
+import json
+import threading
+import zipfile
+from collections import OrderedDict
+
+# Exports are cached per (form version, format); a few recent forms is plenty.
+CACHE_ENTRIES = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def form_digest(form_data) -> str:
+    """
+    Returns a content hash of the form, preserving section and field order.
+    """
+    return hashlib.sha256(json.dumps(form_data, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def iter_markdown(form_data):
+    """
+    Yields the intake form's Markdown piece by piece.
+    """
+    yield "# 🧾 Completed Intake Form\n"
+    for section, fields in form_data.items():
+        yield f"\n## {section}\n"
+        for field, value in fields.items():
+            yield f"**{field.replace('_', ' ').title()}:**\n{value}\n\n"
+
+def to_markdown(form_data):
+    """
+    Renders the intake form as the Markdown document offered for download.
+    """
+    return "".join(iter_markdown(form_data))
+
+def to_json(form_data):
+    return json.dumps(form_data, indent=2, ensure_ascii=False, default=str)
+
+def to_zip(form_data):
+    """
+    Bundles the Markdown and JSON exports with one file per section's LLM notes.
+    """
+    files = [("intake_form.md", to_markdown(form_data)), ("intake_form.json", to_json(form_data))]
+    for section, fields in form_data.items():
+        note = fields.get("llm_note", "").strip()
+        if note:
+            files.append((f"llm_notes/{section.lower().replace(' ', '_')}.md", f"# {section}\n\n{note}\n"))
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for name, content in files:
+            # Fixed timestamps keep the archive byte-identical for identical forms.
+            bundle.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), content)
+    return buffer.getvalue()
+
+# format -> (renderer, file name, MIME type)
+FORMATS = {
+    "markdown": (to_markdown, "intake_form.md", "text/markdown"),
+    "json": (to_json, "intake_form.json", "application/json"),
+    "zip": (to_zip, "intake_form.zip", "application/zip"),
+}
+
+def export(form_data, fmt, version=None):
+    """
+    Returns the form rendered in `fmt`, reusing the cached result for the
+    same form version. `version` is any hashable that changes whenever the
+    form does (e.g. a session ID and edit counter); without one the form's
+    content hash is used, which serialises it.
+    """
+    key = (version or form_digest(form_data), fmt)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    data = FORMATS[fmt][0](form_data)
+    with _cache_lock:
+        _cache[key] = data
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return data
@@ -0,0 +1,156 @@
+# Declarative definition of the intake form. Each section lists its fields in
+# display order; `widget` selects the render_* helper in main.py, `topic`
+# holds the search terms used to pick the reference chunks for the assistant,
+# and `profile` names its default generation profile (see assistant.PROFILES).
+FORM_SECTIONS = [
+    {
+        "name": "Section 1",
+        "title": "📌 Section 1: General Context",
+        "topic": "general context app name purpose clinical value users usage setting guidelines evidence",
+        "columns": True,
+        "fields": [
+            {"widget": "text_area", "label": "App Name", "key": "app_name", "placeholder": "e.g., Framingham Risk Calculator"},
+            {"widget": "text_area", "label": "Purpose & Clinical Value", "key": "purpose", "placeholder": "e.g., Estimates cardiovascular risk..."},
+            {"widget": "radio", "label": "Who is this app for?", "key": "user_type", "options": ["Clinician", "Researcher", "Patient", "Admin", "Other"]},
+            {"widget": "text_area", "label": "User Description / Behavior", "key": "explain_user", "placeholder": "What will the user do? What do they expect?"},
+            {"widget": "radio", "label": "Where is it used?", "key": "usage_context", "options": ["Point-of-care", "In clinic", "Patient home", "Research lab", "Other"]},
+            {"widget": "text_area", "label": "Related Guidelines or Evidence", "key": "guidelines", "placeholder": "Cite supporting references or literature."},
+        ],
+    },
+    {
+        "name": "Section 2",
+        "title": "🧠 Section 2: Core Logic & Computation",
+        "topic": "core logic computation model rules algorithm scoring inputs preprocessing",
+        "columns": True,
+        "fields": [
+            {"widget": "multiselect", "label": "What powers the app?", "key": "method_type",
+             "options": ["Clinical Guideline", "Rule-based Logic", "Statistical Model", "ML Model", "LLM", "RAG"]},
+            {"widget": "text_area", "label": "Model or Rule Description", "key": "model_logic", "placeholder": "Describe logic or model (e.g., logistic regression, scoring system)"},
+            {"widget": "text_area", "label": "Model Inputs & Preprocessing", "key": "model_inputs", "placeholder": "E.g., 'LDL in mg/dL, smokers: Yes/No, missing values trigger warning'"},
+        ],
+    },
+    {
+        "name": "Section 3",
+        "title": "📥 Section 3: Inputs & Data Entry",
+        "topic": "inputs data entry fields types ranges file upload schema format sample",
+        "profile": "lookup",
+        "fields": [
+            {"widget": "text_area", "label": "Structured Input Table", "key": "input_table", "placeholder": "Specify: name, type, range, required, description..."},
+            {"widget": "multiselect", "label": "Accepted File Upload Types", "key": "file_types", "options": ["CSV", "JSON", "PDF", "Image"]},
+            {"widget": "text_area", "label": "File Schema or Format", "key": "file_schema", "placeholder": "Define expected columns, data shape, or upload validation."},
+            {"widget": "checkbox", "label": "Include Sample File?", "key": "include_sample_file"},
+        ],
+    },
+    {
+        "name": "Section 4",
+        "title": "📤 Section 4: Outputs",
+        "topic": "outputs score recommendation chart table interpretation download",
+        "fields": [
+            {"widget": "multiselect", "label": "What does the app output?", "key": "output_types",
+             "options": ["Score", "Recommendation", "Chart", "Table", "Overlay Image", "Downloadable File"]},
+            {"widget": "text_area", "label": "Interpretation Rules or Output Description", "key": "output_notes", "placeholder": "Describe output logic, interpretation, download behavior."},
+        ],
+    },
+    {
+        "name": "Section 5",
+        "title": "🖼 Section 5: Imaging & Overlays",
+        "topic": "imaging images overlays formats DICOM preprocessing bounding boxes heatmaps annotations",
+        "profile": "lookup",
+        "fields": [
+            {"widget": "multiselect", "label": "Input Image Formats", "key": "image_formats", "options": ["JPG", "PNG", "DICOM"]},
+            {"widget": "text_area", "label": "Preprocessing Steps", "key": "preprocessing", "placeholder": "e.g., normalize, resize, grayscale"},
+            {"widget": "multiselect", "label": "Expected Image Output", "key": "image_outputs", "options": ["Bounding boxes", "Heatmaps", "Labeled annotations"]},
+        ],
+    },
+    {
+        "name": "Section 6",
+        "title": "💾 Section 6: Storage & History",
+        "topic": "storage history persistence session retention download",
+        "profile": "lookup",
+        "fields": [
+            {"widget": "radio", "label": "Data Persistence?", "key": "storage_type", "options": ["Stateless", "Session-based", "Persistent"]},
+            {"widget": "text_area", "label": "Download / Retention Logic", "key": "storage_notes", "placeholder": "Who can download or revisit sessions? Retention policy?"},
+        ],
+    },
+    {
+        "name": "Section 7",
+        "title": "📊 Section 7: Document Processing or RAG",
+        "topic": "document processing RAG embedding model vector database retrieval LLM",
+        "fields": [
+            {"widget": "multiselect", "label": "Upload Format", "key": "doc_formats", "options": ["PDF", "DOCX", "JSON"]},
+            {"widget": "checkbox", "label": "Embed at Runtime?", "key": "embed_runtime"},
+            {"widget": "text_area", "label": "Embedding Model", "key": "embedding_model", "placeholder": "e.g., openai/text-embedding-ada"},
+            {"widget": "multiselect", "label": "Vector DB", "key": "vector_db", "options": ["FAISS", "Chroma", "Weaviate", "Pinecone"]},
+            {"widget": "text_area", "label": "LLM Behavior", "key": "rag_role", "placeholder": "What does the LLM do? Summarizer, Q&A, etc."},
+        ],
+    },
+    {
+        "name": "Section 8",
+        "title": "🤖 Section 8: Protocol & Integration Context",
+        "topic": "protocol integration modality Streamlit FastAPI MCP A2A agent fields",
+        "profile": "lookup",
+        "fields": [
+            {"widget": "radio", "label": "Modality", "key": "modality", "options": ["Streamlit", "FastAPI", "MCP", "A2A"]},
+            {"widget": "multiselect", "label": "If MCP, what fields are needed?", "key": "mcp_fields", "options": ["Age", "Labs", "Problems", "Encounter Info"]},
+            {"widget": "multiselect", "label": "If A2A, what is this agent's role?", "key": "a2a_roles", "options": ["Retriever", "Scorer", "Summarizer", "Planner", "Other"]},
+        ],
+    },
+    {
+        "name": "Section 9",
+        "title": "🔐 Section 9: External APIs & Secrets",
+        "topic": "external APIs secrets keys authentication timeout retry fallback",
+        "fields": [
+            {"widget": "text_area", "label": "External APIs", "key": "external_apis", "placeholder": "List APIs called, authentication details"},
+            {"widget": "text_area", "label": "Secrets or API Keys", "key": "secrets", "placeholder": "e.g., OPENAI_API_KEY"},
+            {"widget": "text_area", "label": "Timeout / Retry Logic", "key": "timeouts", "placeholder": "Specify fallback or retry logic"},
+        ],
+    },
+    {
+        "name": "Section 10",
+        "title": "🎨 Section 10: UI/UX & Branding",
+        "topic": "UI UX branding logo sidebar theme visual layout",
+        "profile": "lookup",
+        "fields": [
+            {"widget": "checkbox", "label": "Upload Logo?", "key": "logo_upload"},
+            {"widget": "checkbox", "label": "Sidebar Navigation?", "key": "use_sidebar"},
+            {"widget": "checkbox", "label": "Expandable Sections?", "key": "use_expanders"},
+            {"widget": "checkbox", "label": "Custom Theme?", "key": "custom_css"},
+            {"widget": "text_area", "label": "Describe Visual Journey", "key": "visual_story", "placeholder": "What should user see first?"},
+        ],
+    },
+    {
+        "name": "Section 11",
+        "title": "📄 Section 11: README Metadata",
+        "topic": "README use case limitations evidence citations owner",
+        "fields": [
+            {"widget": "text_area", "label": "Use Case", "key": "use_case", "placeholder": "When and why should this be used?"},
+            {"widget": "text_area", "label": "Limitations", "key": "limitations", "placeholder": "What can it not do?"},
+            {"widget": "text_area", "label": "Evidence / Citations", "key": "evidence", "placeholder": "PMIDs, guidelines, authors"},
+            {"widget": "text_area", "label": "Owner Insight", "key": "insight", "placeholder": "Why did you build this?"},
+        ],
+    },
+    {
+        "name": "Section 12",
+        "title": "🛡 Section 12: Privacy & Compliance",
+        "topic": "privacy compliance PHI PII de-identification HIPAA GDPR regulations security",
+        "fields": [
+            {"widget": "checkbox", "label": "Handles PHI/PII?", "key": "handles_phi"},
+            {"widget": "checkbox", "label": "De-identification Required?", "key": "deid_needed"},
+            {"widget": "multiselect", "label": "Regulations", "key": "regulations", "options": ["HIPAA", "GDPR", "Other"]},
+            {"widget": "text_area", "label": "Privacy Handling", "key": "privacy_controls", "placeholder": "How is data protected, logged, or restricted?"},
+        ],
+    },
+]
+
+def default_value(field):
+    """
+    Returns the value a field's widget holds before the user touches it.
+    """
+    widget = field["widget"]
+    if widget == "radio":
+        return field["options"][0]
+    if widget == "checkbox":
+        return False
+    if widget == "multiselect":
+        return []
+    return ""
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_PATH = os.environ.get("INTAKE_CACHE_PATH", ".cache/llm_responses.sqlite3")
+CACHE_TTL = float(os.environ.get("INTAKE_CACHE_TTL", str(7 * 24 * 3600)))
+MEMORY_ENTRIES = int(os.environ.get("INTAKE_CACHE_MEMORY_ENTRIES", "256"))
+DISK_ENTRIES = int(os.environ.get("INTAKE_CACHE_DISK_ENTRIES", "5000"))
+
+def cache_key(*parts) -> str:
+    """
+    Returns a stable hash of the given request parts (model, system prompt, prompt, ...).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM answers: a bounded in-memory LRU in front of a
+    SQLite table that survives restarts. Entries expire after `ttl` seconds
+    and each tier evicts its least recently used entries past its size limit.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # key -> last memory-tier hit not yet written to disk.
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._db = self._open(path)
+
+    def _open(self, path):
+        if not path:
+            return None
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.commit()
+            return db
+        except (sqlite3.Error, OSError):
+            # Fall back to the in-memory tier only.
+            return None
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if len(self._touched) >= self.memory_entries:
+                    self._flush_touched()
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            # Memory-tier hits must count towards recency before evicting by it.
+            self._flush_touched()
+            self._db.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+            self._db.commit()
+
+    def _flush_touched(self):
+        if self._db is not None and self._touched:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._db.commit()
+        self._touched.clear()
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
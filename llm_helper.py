@@ -1,24 +1,544 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import ResponseCache, cache_key
+from metrics import recorder
+
+# Comma-separated base URLs of the Ollama servers to spread requests across.
+OLLAMA_HOSTS = [h.strip().rstrip("/") for h in os.environ.get("OLLAMA_HOSTS", "http://172.17.0.1:11434").split(",") if h.strip()]
+# A small, fast model answers by default; the reasoning model is used on request.
+DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:3b")
+REASONING_MODEL = os.environ.get("OLLAMA_REASONING_MODEL", "deepseek-r1:latest")
+# Ollama reloads a model whenever num_ctx changes, so profiles share one value
+# and models are pre-warmed with it.
+NUM_CTX = int(os.environ.get("OLLAMA_NUM_CTX", "8192"))
+
+# How long Ollama keeps the model (and its prompt cache) loaded between calls.
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Transport settings, overridable from the environment.
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "300"))
+MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("OLLAMA_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("OLLAMA_BACKOFF_MAX", "8"))
+POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "16"))
+BREAKER_THRESHOLD = int(os.environ.get("OLLAMA_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", "30"))
+HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15"))
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+def _tagged(model):
+    # Ollama reports models with their tag, and an untagged name means ":latest".
+    # Only the last path component can carry a tag; a registry host may have a port.
+    return model if ":" in model.rsplit("/", 1)[-1] else f"{model}:latest"
+
+def _is_reasoning(model):
+    return _tagged(model) == _tagged(REASONING_MODEL)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of contacting Ollama while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive failures, then lets a single
+    trial request through once `cooldown` seconds have passed.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    f"Ollama marked unavailable after {self._failures} consecutive failures; "
+                    f"retrying in {max(remaining, 0):.0f}s"
+                )
+            self._trial_in_flight = True
+
+    def is_open(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            return self._trial_in_flight or time.monotonic() - self._opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class NoEndpointError(requests.exceptions.RequestException):
+    """Raised when every Ollama endpoint is ejected or has its circuit open."""
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.warming = False
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
 
-OLLAMA_URL = "http://172.17.0.1:11434/api/generate"
 
-def ask_ollama(prompt: str, model: str = "deepseek-r1:latest", system_prompt: str = None) -> str:
+class EndpointPool:
     """
-    Sends a prompt to the local Ollama LLM instance and returns the response.
+    Routes each request to the available endpoint with the fewest outstanding
+    requests. Endpoints that fail a health check are ejected until they pass
+    one again, at which point the model is pre-warmed on them.
+    """
+
+    def __init__(self, urls):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self._lock = threading.Lock()
+        self._checker = None
+
+    def acquire(self, exclude=()):
+        with self._lock:
+            available = [e for e in self.endpoints if e.healthy and not e.breaker.is_open() and e not in exclude]
+            if not available:
+                raise NoEndpointError(f"No healthy Ollama endpoint among {', '.join(e.url for e in self.endpoints)}")
+            endpoint = min(available, key=lambda e: e.outstanding)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def check_health(self, model=DEFAULT_MODEL):
+        """
+        Probes every endpoint's /api/ps. Failing endpoints are ejected; healthy
+        ones that do not have `model` loaded are pre-warmed in the background.
+        """
+        for endpoint in self.endpoints:
+            try:
+                response = _session.get(f"{endpoint.url}/api/ps", timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT))
+                response.raise_for_status()
+                loaded = {_tagged(m["name"]) for m in response.json().get("models", []) if m.get("name")}
+            except (requests.exceptions.RequestException, ValueError):
+                endpoint.healthy = False
+                continue
+            endpoint.healthy = True
+            if _tagged(model) not in loaded and not endpoint.warming:
+                threading.Thread(target=_warm, args=(endpoint, model), daemon=True).start()
+
+    def start_health_checks(self, interval=HEALTH_INTERVAL, model=DEFAULT_MODEL):
+        """
+        Runs check_health every `interval` seconds on a daemon thread, once per pool.
+        """
+        def loop():
+            while True:
+                self.check_health(model)
+                time.sleep(interval)
+
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=loop, name="ollama-health", daemon=True)
+                self._checker.start()
+
+    def stats(self):
+        with self._lock:
+            return [
+                {"url": e.url, "healthy": e.healthy, "circuit_open": e.breaker.is_open(), "outstanding": e.outstanding}
+                for e in self.endpoints
+            ]
+
+
+_session = requests.Session()
+_session.headers.update({"Content-Type": "application/json"})
+_adapter = HTTPAdapter(pool_connections=max(POOL_SIZE, len(OLLAMA_HOSTS)), pool_maxsize=POOL_SIZE)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+endpoint_pool = EndpointPool(OLLAMA_HOSTS)
+
+# Running average of prefill cost, used to estimate the savings from KV reuse.
+_prefill_ms_per_token = None
+_prefill_lock = threading.Lock()
+
+response_cache = ResponseCache()
+
+def _warm(endpoint, model):
+    endpoint.warming = True
+    try:
+        # A generate request without a prompt just loads the model.
+        _session.post(
+            f"{endpoint.url}/api/generate",
+            json={"model": model, "keep_alive": KEEP_ALIVE, "options": {"num_ctx": NUM_CTX}},
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        ).close()
+    except requests.exceptions.RequestException:
+        pass
+    finally:
+        endpoint.warming = False
+
+def prewarm(model=DEFAULT_MODEL):
+    """
+    Loads `model` on every endpoint with keep_alive, in parallel, so the first
+    real question does not pay for a cold model load. Blocks until done.
+    """
+    threads = [threading.Thread(target=_warm, args=(endpoint, model), daemon=True) for endpoint in endpoint_pool.endpoints]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def _backoff(attempt):
+    # Full jitter: sleep a random amount up to the exponential ceiling.
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _post(path, payload, stream=False, stats=None):
+    """
+    POSTs to the least-loaded Ollama endpoint over the shared keep-alive
+    session and returns (response, endpoint); the caller must release the
+    endpoint. Connection errors, connect timeouts and 5xx responses are
+    retried, possibly on another endpoint, with jittered backoff; read
+    timeouts are not, since the generation may still be running. The number
+    of retries and the endpoint used are recorded in `stats` when given.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if stats is not None:
+            stats["retries"] = attempt
+        endpoint, refused = None, []
+        while endpoint is None:
+            endpoint = endpoint_pool.acquire(exclude=refused)
+            try:
+                endpoint.breaker.before_request()
+            except CircuitOpenError:
+                # Another request took this endpoint's half-open trial; try the next one.
+                endpoint_pool.release(endpoint)
+                refused.append(endpoint)
+                endpoint = None
+        breaker = endpoint.breaker
+        try:
+            response = _session.post(
+                f"{endpoint.url}{path}",
+                json=payload,
+                stream=stream,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+            endpoint_pool.release(endpoint)
+            breaker.record_failure()
+            if attempt == MAX_RETRIES:
+                raise
+        except requests.exceptions.RequestException:
+            endpoint_pool.release(endpoint)
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                if stats is not None:
+                    stats["endpoint"] = endpoint.url
+                try:
+                    response.raise_for_status()
+                except requests.exceptions.HTTPError:
+                    endpoint_pool.release(endpoint)
+                    raise
+                return response, endpoint
+            endpoint_pool.release(endpoint)
+            breaker.record_failure()
+            if attempt == MAX_RETRIES:
+                response.raise_for_status()
+            response.close()
+        time.sleep(_backoff(attempt))
+
+@contextmanager
+def _request(path, payload, stream=False, stats=None):
     """
-    headers = {"Content-Type": "application/json"}
+    Context manager around _post that closes the response and releases its
+    endpoint when the caller is done reading it.
+    """
+    response, endpoint = _post(path, payload, stream=stream, stats=stats)
+    try:
+        yield response
+    finally:
+        response.close()
+        endpoint_pool.release(endpoint)
+
+def _build_payload(prompt, model, system_prompt, stream, options=None):
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+
     payload = {
         "model": model,
-        "prompt": prompt,
-        "stream": False
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": KEEP_ALIVE
     }
+    if options:
+        payload["options"] = options
+    return payload
 
-    if system_prompt:
-        payload["system"] = system_prompt
+
+class ReasoningFilter:
+    """
+    Removes <think>…</think> reasoning blocks from a model's output as it
+    streams, including tags split across chunks, and the whitespace that
+    precedes the answer. For a `reasoning` model the chat template may have
+    opened the block already, so output is held back until the first tag: a
+    </think> before any <think> closes a block that began with the output.
+    """
+
+    OPEN, CLOSE = "<think>", "</think>"
+
+    def __init__(self, reasoning=False):
+        self._buffer = ""
+        self._thinking = False
+        self._started = False
+        self._undecided = reasoning
+
+    def feed(self, text):
+        self._buffer += text
+        if self._undecided:
+            close, opening = self._buffer.find(self.CLOSE), self._buffer.find(self.OPEN)
+            if close >= 0 and (opening < 0 or close < opening):
+                self._buffer = self._buffer[close + len(self.CLOSE):]
+            elif opening < 0:
+                return ""
+            self._undecided = False
+        out = []
+        while True:
+            tag = self.CLOSE if self._thinking else self.OPEN
+            i = self._buffer.find(tag)
+            if i < 0:
+                break
+            if not self._thinking:
+                out.append(self._buffer[:i])
+            self._buffer = self._buffer[i + len(tag):]
+            self._thinking = not self._thinking
+        # Hold back anything that may be the start of a tag split across chunks.
+        keep = next((k for k in range(len(tag) - 1, 0, -1) if self._buffer.endswith(tag[:k])), 0)
+        if not self._thinking:
+            out.append(self._buffer[:len(self._buffer) - keep])
+        self._buffer = self._buffer[len(self._buffer) - keep:]
+        return self._emit("".join(out))
+
+    def flush(self):
+        text = "" if self._thinking else self._buffer
+        self._buffer = ""
+        return self._emit(text)
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+def strip_reasoning(text, reasoning=False):
+    """
+    Returns `text` without its <think>…</think> reasoning blocks; see
+    ReasoningFilter for `reasoning`.
+    """
+    reasoning = ReasoningFilter(reasoning)
+    return (reasoning.feed(text) + reasoning.flush()).strip()
+
+def _record_stats(stats, final, prompt_chars):
+    """
+    Copies Ollama's timing counters from the final response into `stats` and
+    estimates how much prefill was skipped by reusing the cached prompt prefix.
+    """
+    global _prefill_ms_per_token
+
+    for field in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "load_duration", "total_duration"):
+        stats[field] = final.get(field, 0)
+
+    evaluated = stats["prompt_eval_count"]
+    with _prefill_lock:
+        # Only calls that actually prefilled a sizeable prompt give a usable rate.
+        if evaluated >= 32:
+            rate = stats["prompt_eval_duration"] / 1e6 / evaluated
+            _prefill_ms_per_token = rate if _prefill_ms_per_token is None else 0.8 * _prefill_ms_per_token + 0.2 * rate
+        rate = _prefill_ms_per_token
+
+    # Roughly four characters per token for English text.
+    reused = max(0, prompt_chars // 4 - evaluated)
+    stats["prompt_tokens_reused"] = reused
+    stats["prefill_saved_ms"] = reused * rate if rate is not None else 0.0
+    if stats["eval_duration"]:
+        stats["tokens_per_second"] = stats["eval_count"] / (stats["eval_duration"] / 1e9)
+
+def _record_call(model, stats, started, prompt_chars, outcome, use_cache):
+    stats["seconds"] = time.perf_counter() - started
+    stats["outcome"] = outcome
+    stats["cache"] = "bypass" if not use_cache else ("hit" if stats.get("cached") else "miss")
+    recorder.record(
+        "llm",
+        model=model,
+        prompt_chars=prompt_chars,
+        prompt_tokens_estimate=prompt_chars // 4,
+        **{k: v for k, v in stats.items() if k not in ("cached",)},
+    )
+
+# Shown alongside answers whose stats have "truncated" set.
+TRUNCATED_NOTE = "⚠️ The answer was cut off at its length limit."
+EMPTY_REPLY_ERROR = "❌ No answer: the model used its whole length limit while reasoning."
+
+def _check_truncation(stats, final, reply):
+    """
+    Records whether Ollama stopped at num_predict and returns the outcome:
+    "ok", "truncated" (partial answer) or "error" (nothing left after
+    stripping the reasoning). Only "ok" answers are cached.
+    """
+    stats["truncated"] = final.get("done_reason") == "length"
+    if not reply:
+        return "error"
+    return "truncated" if stats["truncated"] else "ok"
+
+def describe_prefill(stats) -> str:
+    """
+    Returns a one-line summary of the prefill work for a call, or "" if unknown.
+    """
+    if stats.get("cached"):
+        return "Served from cache; no generation needed."
+    if "prompt_eval_count" not in stats:
+        return ""
+    summary = f"Prefill: {stats['prompt_eval_count']} new tokens in {stats['prompt_eval_duration'] / 1e6:.0f} ms"
+    if stats["prompt_tokens_reused"]:
+        summary += f" · ~{stats['prompt_tokens_reused']} cached tokens reused (~{stats['prefill_saved_ms']:.0f} ms saved)"
+    return summary
+
+def cached_reply(prompt: str, model: str = DEFAULT_MODEL, system_prompt: str = None, stats: dict = None, options: dict = None):
+    """
+    Returns the cached answer for this request, recording the cache hit, or
+    None if there is none.
+    """
+    started = time.perf_counter()
+    cached = response_cache.get(cache_key(model, system_prompt, prompt, options))
+    if cached is not None:
+        stats = {} if stats is None else stats
+        stats["cached"] = True
+        stats["ttft"] = time.perf_counter() - started
+        _record_call(model, stats, started, len(prompt) + len(system_prompt or ""), "ok", True)
+    return cached
+
+def ask_ollama(prompt: str, model: str = DEFAULT_MODEL, system_prompt: str = None, use_cache: bool = True, stats: dict = None,
+               options: dict = None) -> str:
+    """
+    Sends a prompt to the local Ollama LLM instance and returns the response,
+    without any reasoning blocks. `options` are passed to Ollama as generation
+    parameters (num_predict, num_ctx, temperature, ...). Answers are served
+    from `response_cache` unless `use_cache` is False. If `stats` is given it
+    is filled with Ollama's timing counters.
+    """
+    stats = {} if stats is None else stats
+    if use_cache:
+        cached = cached_reply(prompt, model, system_prompt, stats, options)
+        if cached is not None:
+            return cached
+    started = time.perf_counter()
+    prompt_chars = len(prompt) + len(system_prompt or "")
+    key = cache_key(model, system_prompt, prompt, options)
+
+    payload = _build_payload(prompt, model, system_prompt, stream=False, options=options)
 
     try:
-        response = requests.post(OLLAMA_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json().get("response", "").strip()
-    except requests.exceptions.RequestException as e:
+        with _request("/api/chat", payload, stats=stats) as response:
+            final = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        _record_call(model, stats, started, prompt_chars, "error", use_cache)
         return f"❌ Error contacting LLM: {e}"
+
+    # No ttft: a non-streamed reply arrives all at once, so it would only repeat the wall time.
+    reply = strip_reasoning(final.get("message", {}).get("content", ""), _is_reasoning(model))
+    _record_stats(stats, final, prompt_chars)
+    outcome = _check_truncation(stats, final, reply)
+    _record_call(model, stats, started, prompt_chars, outcome, use_cache)
+    if outcome == "error":
+        return EMPTY_REPLY_ERROR
+    if outcome == "ok":
+        response_cache.set(key, reply)
+    return reply
+
+def stream_generation(prompt: str, model: str = DEFAULT_MODEL, system_prompt: str = None, use_cache: bool = True, stats: dict = None,
+                      options: dict = None):
+    """
+    Sends a prompt to the local Ollama LLM instance and yields the response
+    text chunk by chunk as Ollama's NDJSON stream arrives, with reasoning
+    blocks filtered out. `options` are as for ask_ollama. It always
+    generates: look the request up with cached_reply first. The finished
+    answer is cached, and `use_cache` only labels the call as a miss or a
+    bypass. If `stats` is given it is filled with Ollama's timing counters
+    once the stream ends.
+    """
+    stats = {} if stats is None else stats
+    started = time.perf_counter()
+    prompt_chars = len(prompt) + len(system_prompt or "")
+    # Stays "abandoned" if the consumer stops iterating before the end.
+    outcome = "abandoned"
+    key = cache_key(model, system_prompt, prompt, options)
+
+    try:
+        payload = _build_payload(prompt, model, system_prompt, stream=True, options=options)
+        parts = []
+        final = None
+        reasoning = ReasoningFilter(_is_reasoning(model))
+
+        try:
+            with _request("/api/chat", payload, stream=True, stats=stats) as response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        outcome = "error"
+                        yield f"❌ Error contacting LLM: {chunk['error']}"
+                        return
+                    text = reasoning.feed(chunk.get("message", {}).get("content", ""))
+                    if chunk.get("done"):
+                        text += reasoning.flush()
+                    if text:
+                        stats.setdefault("ttft", time.perf_counter() - started)
+                        parts.append(text)
+                        yield text
+                    if chunk.get("done"):
+                        _record_stats(stats, chunk, prompt_chars)
+                        final = chunk
+                        break
+        except (requests.exceptions.RequestException, ValueError) as e:
+            outcome = "error"
+            yield f"❌ Error contacting LLM: {e}"
+            return
+
+        if final is not None:
+            # Only complete answers are cached, not ones cut off at num_predict.
+            reply = "".join(parts).strip()
+            outcome = _check_truncation(stats, final, reply)
+            if outcome == "error":
+                yield EMPTY_REPLY_ERROR
+            elif outcome == "ok":
+                response_cache.set(key, reply)
+    finally:
+        _record_call(model, stats, started, prompt_chars, outcome, use_cache)
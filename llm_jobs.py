@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from llm_cache import cache_key
+from llm_helper import DEFAULT_MODEL, cached_reply, stream_generation
+
+# Generations running at once across every session in this process.
+JOB_WORKERS = int(os.environ.get("INTAKE_LLM_WORKERS", "4"))
+# Admission control: submissions beyond these limits are refused, not queued.
+MAX_QUEUED = int(os.environ.get("INTAKE_LLM_MAX_QUEUED", "64"))
+MAX_QUEUED_PER_USER = int(os.environ.get("INTAKE_LLM_MAX_QUEUED_PER_USER", "16"))
+# Finished jobs are kept this long so sessions can pick up their results.
+JOB_TTL = float(os.environ.get("INTAKE_LLM_JOB_TTL", "600"))
+
+
+class QueueFullError(Exception):
+    """Raised when a job is refused because the queue or the user's share of it is full."""
+
+
+class Job:
+    """
+    One generation. `text` grows as Ollama streams tokens; `result` is set
+    once the job has finished.
+    """
+
+    def __init__(self, key, user, prompt, system_prompt, model, options, use_cache):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.user = user
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.model = model
+        self.options = options
+        self.use_cache = use_cache
+        self.status = "queued"
+        self.parts = []
+        self.result = None
+        self.stats = {}
+        self.finished_at = None
+
+    @property
+    def text(self):
+        return self.result if self.result is not None else "".join(self.parts)
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+
+class JobQueue:
+    """
+    Process-wide queue for LLM generations. At most `workers` jobs run at a
+    time; queued jobs are dispatched round-robin across users so one session
+    cannot starve the others, and a prompt already queued or running is
+    joined rather than generated twice.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=MAX_QUEUED, max_queued_per_user=MAX_QUEUED_PER_USER, ttl=JOB_TTL):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.ttl = ttl
+        self.coalesced = 0
+        self.rejected = 0
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._queues = {}
+        self._turns = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._threads = []
+
+    def submit(self, user, prompt, system_prompt=None, model=DEFAULT_MODEL, options=None, use_cache=True):
+        """
+        Queues a generation and returns its job ID at once. An identical
+        request that is already queued or running returns that job's ID.
+        Raises QueueFullError if the job cannot be admitted.
+        """
+        key = cache_key(model, system_prompt, prompt, options)
+        with self._lock:
+            self._prune()
+            joined = self._join(key)
+            if joined is not None:
+                return joined
+            # Refuse before the cache lookup so a rejected request is not counted as a miss.
+            self._admit(user)
+
+        job = Job(key, user, prompt, system_prompt, model, options, use_cache)
+        # The only cache lookup for a queued request; workers always generate.
+        # It runs unlocked so a slow disk read does not hold up other sessions.
+        cached = cached_reply(prompt, model, system_prompt, job.stats, options) if use_cache else None
+
+        with self._lock:
+            if cached is not None:
+                # Answered already; don't make it wait behind running generations.
+                self._finish(job, "done", cached)
+                self._jobs[job.id] = job
+                return job.id
+
+            # Another session may have submitted the same request, or filled the queue, meanwhile.
+            joined = self._join(key)
+            if joined is not None:
+                return joined
+            self._admit(user)
+
+            self._queues.setdefault(user, deque()).append(job)
+            if user not in self._turns:
+                self._turns.append(user)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            self._start_workers()
+            self._ready.notify()
+            return job.id
+
+    def _join(self, key):
+        # Called with the lock held. Returns the ID of an identical queued or running job.
+        job = self._in_flight.get(key)
+        if job is None:
+            return None
+        self.coalesced += 1
+        return job.id
+
+    def _admit(self, user):
+        # Called with the lock held. Raises QueueFullError if `user` may not queue another job.
+        user_queue = self._queues.get(user, ())
+        if sum(len(q) for q in self._queues.values()) >= self.max_queued:
+            self.rejected += 1
+            raise QueueFullError(f"The assistant is busy ({self.max_queued} questions waiting). Please try again shortly.")
+        if len(user_queue) >= self.max_queued_per_user:
+            self.rejected += 1
+            raise QueueFullError(f"You already have {len(user_queue)} questions waiting. Please wait for them to finish.")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """
+        Returns how many queued jobs will be dispatched before this one, or
+        None if the job is no longer queued.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return None
+            # Replay the round-robin dispatch order.
+            queues = [self._queues[user] for user in self._turns]
+            ahead = 0
+            for depth in range(max(len(q) for q in queues)):
+                for q in queues:
+                    if depth < len(q):
+                        if q[depth] is job:
+                            return ahead
+                        ahead += 1
+            return None
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"llm-job-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next(self):
+        # Called with the lock held. Takes the oldest job of the user whose turn it is.
+        user = self._turns.popleft()
+        user_queue = self._queues[user]
+        job = user_queue.popleft()
+        if user_queue:
+            self._turns.append(user)
+        else:
+            del self._queues[user]
+        return job
+
+    def _work(self):
+        while True:
+            with self._ready:
+                while not self._turns:
+                    self._ready.wait()
+                job = self._next()
+                job.status = "running"
+                self._running += 1
+
+            try:
+                for text in stream_generation(job.prompt, model=job.model, system_prompt=job.system_prompt,
+                                              use_cache=job.use_cache, stats=job.stats, options=job.options):
+                    job.parts.append(text)
+                status = "error" if job.stats.get("outcome") == "error" else "done"
+            except Exception as e:
+                job.parts.append(f"❌ Error contacting LLM: {e}")
+                status = "error"
+
+            with self._lock:
+                self._running -= 1
+                self._in_flight.pop(job.key, None)
+                # A failed stream ends with the error message; report just that.
+                self._finish(job, status, job.parts[-1] if status == "error" else "".join(job.parts).strip())
+
+    def _finish(self, job, status, result):
+        # Called with the lock held.
+        job.result = result
+        job.status = status
+        job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done or job.finished_at > cutoff:
+                break
+            self._jobs.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "users_waiting": len(self._turns),
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+job_queue = JobQueue()
@@ -1,6 +1,24 @@
+import os
+import statistics
+import time
+import uuid
+
 import streamlit as st
 from pathlib import Path
-from llm_helper import ask_ollama
+from llm_helper import TRUNCATED_NOTE, describe_prefill, endpoint_pool, response_cache
+from llm_jobs import QueueFullError, job_queue
+from metrics import recorder, serve as serve_metrics
+from form_export import FORMATS, export
+from form_schema import FORM_SECTIONS
+from assistant import DRAFT_QUESTION, SECTIONS, build_prompt, choose_profile, is_error, profile_request
+from ref_store import RefDocStore
+from session_store import SessionStore
+
+# How often queued answers and drafts are polled while they are pending.
+POLL_SECONDS = 0.5
+
+rerun_started = time.perf_counter()
+serve_metrics()
 
 st.set_page_config(page_title="Health Universe Intake Tool", layout="wide")
 st.title("🧠 Health Universe App Intake Form")
@@ -10,8 +28,134 @@ if css_file.exists():
     with open(css_file) as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def start_llm_backend():
+    # The first health check runs at once and pre-warms the model on every endpoint.
+    endpoint_pool.start_health_checks()
+    return endpoint_pool
+
+start_llm_backend()
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    return SessionStore()
+
+def restore_session(session_id):
+    """
+    Loads a saved session into form_data and the widgets that display it.
+    Returns False, leaving the current form alone, if no such session exists.
+    """
+    store = get_session_store()
+    if not store.exists(session_id):
+        return False
+    if "pending_changes" in st.session_state:
+        save_changes()
+    form_data = store.load(session_id)
+    # Clear every widget and assistant key so nothing from the current form
+    # carries over into (and is then autosaved under) the restored session.
+    for n, spec in enumerate(FORM_SECTIONS, start=1):
+        keys = [f"{spec['name']}_{field['key']}" for field in spec["fields"]]
+        for key in keys + [f"q_{n}", f"llm_response_{n}", f"llm_summary_{n}", f"llm_job_{n}"]:
+            st.session_state.pop(key, None)
+    st.session_state.pop("draft_jobs", None)
+    for section, fields in form_data.items():
+        for key, value in fields.items():
+            if key != "llm_note":
+                st.session_state[f"{section}_{key}"] = value
+    st.session_state.form_data = form_data
+    st.session_state.pending_changes = {}
+    st.session_state.form_version = {"token": uuid.uuid4().hex, "revision": 0}
+    st.session_state.session_id = session_id
+    st.query_params["sid"] = session_id
+    return True
+
+def set_field(section, key, value, default=""):
+    """
+    Stores a field value, queueing it for autosave only if it changed. A
+    field seen for the first time is saved only if it differs from its
+    widget's `default`, so merely opening the page persists nothing.
+    """
+    fields = st.session_state.form_data.setdefault(section, {})
+    previous = fields.get(key, default)
+    if key not in fields or previous != value:
+        # Versions the form for the export cache, so exports never rehash it.
+        st.session_state.form_version["revision"] += 1
+    if previous != value:
+        st.session_state.pending_changes[(section, key)] = value
+    fields[key] = value
+
+def save_changes():
+    """
+    Autosaves the fields changed since the last save in one transaction.
+    """
+    if st.session_state.pending_changes:
+        get_session_store().save(st.session_state.session_id, st.session_state.pending_changes)
+        st.session_state.pending_changes = {}
+
 if "form_data" not in st.session_state:
-    st.session_state.form_data = {}
+    if not (st.query_params.get("sid") and restore_session(st.query_params["sid"])):
+        st.session_state.form_data = {}
+        st.session_state.pending_changes = {}
+        st.session_state.form_version = {"token": uuid.uuid4().hex, "revision": 0}
+        st.session_state.session_id = uuid.uuid4().hex[:12]
+        st.query_params["sid"] = st.session_state.session_id
+
+@st.cache_resource(show_spinner=False)
+def get_ref_store():
+    return RefDocStore()
+
+def reference_index():
+    """
+    Returns the shared index for this session's reference document, if any.
+    """
+    return get_ref_store().index(st.session_state.get("ref_digest"))
+
+def submit_drafts():
+    """
+    Queues a draft for every section that has no notes yet, so drafting
+    again never duplicates a note. Drafts share the app-wide job queue, so
+    they count against its concurrency limit; the job IDs are kept in session
+    state so drafts finishing after an interrupted run are still inserted.
+    """
+    index = reference_index()
+    model, options = profile_request("draft")
+    jobs = st.session_state.draft_jobs = {}
+    st.session_state.drafts_done = 0
+    st.session_state.draft_errors = []
+    pending = [section for section in SECTIONS if not st.session_state.form_data.get(section, {}).get("llm_note")]
+    if not pending:
+        st.info("Every section already has notes.")
+    try:
+        for section in pending:
+            system_prompt, prompt = build_prompt(section, DRAFT_QUESTION, index)
+            jobs[job_queue.submit(st.session_state.session_id, prompt, system_prompt, model, options)] = section
+    except QueueFullError as e:
+        st.warning(str(e))
+
+@st.fragment(run_every=POLL_SECONDS)
+def draft_progress():
+    """
+    Inserts each draft into its section's notes as it finishes and shows
+    progress, polling until every draft is in.
+    """
+    jobs = st.session_state.draft_jobs
+    for job_id, section in list(jobs.items()):
+        job = job_queue.get(job_id)
+        if job is not None and not job.done:
+            continue
+        del jobs[job_id]
+        st.session_state.drafts_done += 1
+        if job is None or is_error(job.result):
+            st.session_state.draft_errors.append(f"{section}: {job.result if job else 'draft expired'}")
+            continue
+        current = st.session_state.form_data.get(section, {}).get("llm_note", "")
+        set_field(section, "llm_note", current + "\n" + job.result)
+    save_changes()
+    done = st.session_state.drafts_done
+    st.progress(done / (done + len(jobs)), text=f"Drafted {done} / {done + len(jobs)} sections")
+    if not jobs:
+        # All in; rerun the app to stop polling and refresh the export area.
+        st.rerun()
 
 with st.sidebar:
     #st.image("logo.png", use_column_width=True)  # Optional: remove if no logo file
@@ -21,380 +165,200 @@ with st.sidebar:
 
     st.header("📄 Reference Document")
     uploaded_file = st.file_uploader("Upload .md file", type=["md"])
-    if uploaded_file:
-        st.session_state["ref_doc"] = uploaded_file.read().decode("utf-8")
-    else:
-        st.session_state["ref_doc"] = ""
+    if uploaded_file is None:
+        st.session_state["ref_digest"] = st.session_state["ref_file_id"] = None
+    elif st.session_state.get("ref_file_id") != uploaded_file.file_id:
+        # Only a new upload is hashed and ingested; reruns reuse the digest.
+        st.session_state["ref_digest"] = get_ref_store().ingest(uploaded_file.getvalue())
+        st.session_state["ref_file_id"] = uploaded_file.file_id
+
+    drafting = bool(st.session_state.get("draft_jobs"))
+    if st.button("✍️ Draft all sections", disabled=drafting or not st.session_state["ref_digest"],
+                 help="Pre-draft the assistant notes for every section without notes, from the reference document."):
+        submit_drafts()
+    if st.session_state.get("draft_jobs"):
+        draft_progress()
+    for error in st.session_state.get("draft_errors", []):
+        st.warning(error)
 
     st.markdown("---")
     st.header("✅ Form Progress")
     completed_sections = sum(bool(v) for v in st.session_state.form_data.values())
     st.write(f"Sections Completed: {completed_sections} / 12")
+
+    st.markdown("---")
+    st.header("💾 Session")
+    st.caption(f"Autosaved as `{st.session_state.session_id}`. Bookmark this page to come back to it.")
+    resume_id = st.text_input("Resume a saved session", placeholder="Session ID").strip()
+    if st.button("Resume", disabled=not resume_id):
+        if restore_session(resume_id):
+            st.rerun()
+        st.error(f"No saved session with ID `{resume_id}`.")
+
+    if os.environ.get("INTAKE_DEBUG") or st.query_params.get("debug") == "1":
+        with st.expander("🛠 Performance"):
+            reruns = [e["seconds"] for e in recorder.recent("rerun", limit=200) if e["scope"] == "app"]
+            if reruns:
+                st.write(f"Last rerun: {reruns[-1] * 1000:.0f} ms · median {statistics.median(reruns) * 1000:.0f} ms "
+                         f"over {len(reruns)} reruns")
+            calls = recorder.recent("llm", limit=20)
+            if calls:
+                columns = ("model", "outcome", "cache", "seconds", "ttft", "prompt_chars",
+                           "prompt_eval_count", "eval_count", "tokens_per_second", "retries")
+                st.dataframe([{c: e.get(c) for c in columns} for e in reversed(calls)], hide_index=True)
+            st.json({
+                "ollama_endpoints": endpoint_pool.stats(),
+                "llm_jobs": job_queue.stats(),
+                "response_cache": response_cache.stats(),
+                "reference_docs": get_ref_store().stats(),
+            })
 def render_text_area(section, label, key, placeholder=""):
     value = st.text_area(label, placeholder=placeholder, key=f"{section}_{key}")
-    st.session_state.form_data[section][key] = value
+    set_field(section, key, value)
 
 def render_radio(section, label, key, options):
     value = st.radio(label, options, key=f"{section}_{key}")
-    st.session_state.form_data[section][key] = value
+    set_field(section, key, value, options[0])
 
 def render_checkbox(section, label, key):
     value = st.checkbox(label, key=f"{section}_{key}")
-    st.session_state.form_data[section][key] = value
+    set_field(section, key, value, False)
 
 def render_multiselect(section, label, key, options):
     value = st.multiselect(label, options, key=f"{section}_{key}")
-    st.session_state.form_data[section][key] = value
+    set_field(section, key, value, [])
+
+def submit_question(section, question, escalate=False):
+    """
+    Queues the assistant's answer with the profile suited to the question and
+    returns the job ID without waiting for it.
+    """
+    index = reference_index()
+    system_prompt, prompt = build_prompt(section, question, index)
+    model, options = profile_request(choose_profile(section, question, escalate))
+    return job_queue.submit(st.session_state.session_id, prompt, system_prompt, model, options)
+
+@st.fragment(run_every=POLL_SECONDS)
+def follow_job(n):
+    """
+    Shows the queue position and then the partial answer for section n's
+    job, polling on its own so the rest of the page never waits for it.
+    Once the job finishes its answer is stored and the app reruns.
+    """
+    job_id = st.session_state[f"llm_job_{n}"]
+    job = job_queue.get(job_id)
+    if job is None:
+        st.session_state[f"llm_job_{n}"] = None
+        st.warning("The answer expired before it could be shown. Please ask again.")
+    elif job.done:
+        st.session_state[f"llm_job_{n}"] = None
+        st.session_state[f"llm_response_{n}"] = job.result
+        truncated = TRUNCATED_NOTE if job.stats.get("truncated") else ""
+        st.session_state[f"llm_summary_{n}"] = " · ".join(filter(None, [truncated, job.model, describe_prefill(job.stats)]))
+        st.rerun()
+    else:
+        position = job_queue.position(job_id)
+        if position is not None:
+            st.info(f"⏳ Queued: {position} question(s) ahead of yours.")
+        elif job.text:
+            st.markdown(job.text + " ▌")
+        else:
+            st.info("✍️ Generating...")
+
+def render_field(section, field):
+    widget = field["widget"]
+    if widget == "text_area":
+        render_text_area(section, field["label"], field["key"], field.get("placeholder", ""))
+    elif widget == "radio":
+        render_radio(section, field["label"], field["key"], field["options"])
+    elif widget == "checkbox":
+        render_checkbox(section, field["label"], field["key"])
+    elif widget == "multiselect":
+        render_multiselect(section, field["label"], field["key"], field["options"])
 
-# Section 1: General Context (Detailed)
-with st.expander("📌 Section 1: General Context"):
-    section = "Section 1"
+def render_assistant(section, n):
+    st.markdown("### 💬 Assistant")
+    user_question = st.text_area("Ask your question here", key=f"q_{n}")
+    response_key = f"llm_response_{n}"
+    job_key = f"llm_job_{n}"
+    escalate = st.toggle("🧠 Think it through (slower reasoning model)", key=f"r_{n}")
+    if st.button("Get Answer", key=f"a_{n}"):
+        try:
+            st.session_state[job_key] = submit_question(section, user_question, escalate)
+        except QueueFullError as e:
+            st.warning(str(e))
+    if st.session_state.get(job_key):
+        follow_job(n)
+    elif response_key in st.session_state:
+        st.write(st.session_state[response_key])
+        if st.session_state.get(f"llm_summary_{n}"):
+            st.caption(st.session_state[f"llm_summary_{n}"])
+    if response_key in st.session_state:
+        if st.button("Insert into Section", key=f"i_{n}"):
+            current = st.session_state.form_data[section].get("llm_note", "")
+            set_field(section, "llm_note", current + "\n" + st.session_state[response_key])
+            st.success("✅ Inserted response into notes.")
+    if st.button("Close Assistant", key=f"c_{n}"):
+        st.session_state["llm_section"] = None
+
+@st.fragment
+def render_section(spec, n):
+    """
+    Draws one form section and its assistant. As a fragment, interacting with
+    it reruns only this section rather than the whole form.
+    """
+    started = time.perf_counter()
+    section = spec["name"]
     st.session_state.form_data.setdefault(section, {})
-    left, right = st.columns([2, 1])
+    if spec.get("columns"):
+        left, right = st.columns([2, 1])
+    else:
+        left = right = st.container()
+
     with left:
-        render_text_area(section, "App Name", "app_name", "e.g., Framingham Risk Calculator")
-        render_text_area(section, "Purpose & Clinical Value", "purpose", "e.g., Estimates cardiovascular risk...")
-        render_radio(section, "Who is this app for?", "user_type", ["Clinician", "Researcher", "Patient", "Admin", "Other"])
-        render_text_area(section, "User Description / Behavior", "explain_user", "What will the user do? What do they expect?")
-        render_radio(section, "Where is it used?", "usage_context", ["Point-of-care", "In clinic", "Patient home", "Research lab", "Other"])
-        render_text_area(section, "Related Guidelines or Evidence", "guidelines", "Cite supporting references or literature.")
-        if st.button("💡 Ask Assistant (Section 1)"):
+        for field in spec["fields"]:
+            render_field(section, field)
+        if st.button(f"💡 Ask Assistant ({section})"):
+            previous = st.session_state.get("llm_section")
             st.session_state["llm_section"] = section
+            if previous not in (None, section):
+                # Another section's panel is open; rerun the app to close it.
+                st.rerun()
     with right:
         if st.session_state.get("llm_section") == section:
-            st.markdown("### 💬 Assistant")
-            user_question = st.text_area("Ask your question here", key="q_1")
-            if st.button("Get Answer", key="a_1"):
-                context = st.session_state.get("ref_doc", "")
-                prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-                reply = ask_ollama(prompt)
-                st.session_state["llm_response_1"] = reply
-            if "llm_response_1" in st.session_state:
-                st.write(st.session_state["llm_response_1"])
-                if st.button("Insert into Section", key="i_1"):
-                    current = st.session_state.form_data[section].get("llm_note", "")
-                    st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_1"]
-                    st.success("✅ Inserted response into notes.")
-            if st.button("Close Assistant", key="c_1"):
-                st.session_state["llm_section"] = None
-
-
-# Section 2: Core Logic & Computation
-with st.expander("🧠 Section 2: Core Logic & Computation"):
-    section = "Section 2"
-    st.session_state.form_data.setdefault(section, {})
-    left, right = st.columns([2, 1])
-    with left:
-        render_multiselect(section, "What powers the app?", "method_type",
-            ["Clinical Guideline", "Rule-based Logic", "Statistical Model", "ML Model", "LLM", "RAG"])
-        render_text_area(section, "Model or Rule Description", "model_logic", "Describe logic or model (e.g., logistic regression, scoring system)")
-        render_text_area(section, "Model Inputs & Preprocessing", "model_inputs", "E.g., 'LDL in mg/dL, smokers: Yes/No, missing values trigger warning'")
-    with right:
-        if st.button("💡 Ask Assistant (Section 2)"):
-            st.session_state["llm_section"] = section
-        if st.session_state.get("llm_section") == section:
-            st.markdown("### 💬 Assistant")
-            user_question = st.text_area("Ask your question here", key="q_2")
-            if st.button("Get Answer", key="a_2"):
-                context = st.session_state.get("ref_doc", "")
-                prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-                reply = ask_ollama(prompt)
-                st.session_state["llm_response_2"] = reply
-            if "llm_response_2" in st.session_state:
-                st.write(st.session_state["llm_response_2"])
-                if st.button("Insert into Section", key="i_2"):
-                    current = st.session_state.form_data[section].get("llm_note", "")
-                    st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_2"]
-                    st.success("✅ Inserted response into notes.")
-            if st.button("Close Assistant", key="c_2"):
-                st.session_state["llm_section"] = None
-
-
-# Section 3: Inputs & Data Entry
-with st.expander("📥 Section 3: Inputs & Data Entry"):
-    section = "Section 3"
-    st.session_state.form_data.setdefault(section, {})
-    render_text_area(section, "Structured Input Table", "input_table", "Specify: name, type, range, required, description...")
-    render_multiselect(section, "Accepted File Upload Types", "file_types", ["CSV", "JSON", "PDF", "Image"])
-    render_text_area(section, "File Schema or Format", "file_schema", "Define expected columns, data shape, or upload validation.")
-    render_checkbox(section, "Include Sample File?", "include_sample_file")
-    if st.button("💡 Ask Assistant (Section 3)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_3")
-        if st.button("Get Answer", key="a_3"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_3"] = reply
-        if "llm_response_3" in st.session_state:
-            st.write(st.session_state["llm_response_3"])
-            if st.button("Insert into Section", key="i_3"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_3"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_3"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 4: Outputs
-with st.expander("📤 Section 4: Outputs"):
-    section = "Section 4"
-    st.session_state.form_data.setdefault(section, {})
-    render_multiselect(section, "What does the app output?", "output_types", ["Score", "Recommendation", "Chart", "Table", "Overlay Image", "Downloadable File"])
-    render_text_area(section, "Interpretation Rules or Output Description", "output_notes", "Describe output logic, interpretation, download behavior.")
-    if st.button("💡 Ask Assistant (Section 4)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_4")
-        if st.button("Get Answer", key="a_4"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_4"] = reply
-        if "llm_response_4" in st.session_state:
-            st.write(st.session_state["llm_response_4"])
-            if st.button("Insert into Section", key="i_4"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_4"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_4"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 5: Imaging & Overlays
-with st.expander("🖼 Section 5: Imaging & Overlays"):
-    section = "Section 5"
-    st.session_state.form_data.setdefault(section, {})
-    render_multiselect(section, "Input Image Formats", "image_formats", ["JPG", "PNG", "DICOM"])
-    render_text_area(section, "Preprocessing Steps", "preprocessing", "e.g., normalize, resize, grayscale")
-    render_multiselect(section, "Expected Image Output", "image_outputs", ["Bounding boxes", "Heatmaps", "Labeled annotations"])
-    if st.button("💡 Ask Assistant (Section 5)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_5")
-        if st.button("Get Answer", key="a_5"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_5"] = reply
-        if "llm_response_5" in st.session_state:
-            st.write(st.session_state["llm_response_5"])
-            if st.button("Insert into Section", key="i_5"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_5"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_5"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 6: Storage & History
-with st.expander("💾 Section 6: Storage & History"):
-    section = "Section 6"
-    st.session_state.form_data.setdefault(section, {})
-    render_radio(section, "Data Persistence?", "storage_type", ["Stateless", "Session-based", "Persistent"])
-    render_text_area(section, "Download / Retention Logic", "storage_notes", "Who can download or revisit sessions? Retention policy?")
-    if st.button("💡 Ask Assistant (Section 6)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_6")
-        if st.button("Get Answer", key="a_6"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_6"] = reply
-        if "llm_response_6" in st.session_state:
-            st.write(st.session_state["llm_response_6"])
-            if st.button("Insert into Section", key="i_6"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_6"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_6"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 7: Document Processing or RAG
-with st.expander("📊 Section 7: Document Processing or RAG"):
-    section = "Section 7"
-    st.session_state.form_data.setdefault(section, {})
-    render_multiselect(section, "Upload Format", "doc_formats", ["PDF", "DOCX", "JSON"])
-    render_checkbox(section, "Embed at Runtime?", "embed_runtime")
-    render_text_area(section, "Embedding Model", "embedding_model", "e.g., openai/text-embedding-ada")
-    render_multiselect(section, "Vector DB", "vector_db", ["FAISS", "Chroma", "Weaviate", "Pinecone"])
-    render_text_area(section, "LLM Behavior", "rag_role", "What does the LLM do? Summarizer, Q&A, etc.")
-    if st.button("💡 Ask Assistant (Section 7)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_7")
-        if st.button("Get Answer", key="a_7"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_7"] = reply
-        if "llm_response_7" in st.session_state:
-            st.write(st.session_state["llm_response_7"])
-            if st.button("Insert into Section", key="i_7"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_7"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_7"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 8: Protocol & Integration Context
-with st.expander("🤖 Section 8: Protocol & Integration Context"):
-    section = "Section 8"
-    st.session_state.form_data.setdefault(section, {})
-    render_radio(section, "Modality", "modality", ["Streamlit", "FastAPI", "MCP", "A2A"])
-    render_multiselect(section, "If MCP, what fields are needed?", "mcp_fields", ["Age", "Labs", "Problems", "Encounter Info"])
-    render_multiselect(section, "If A2A, what is this agent's role?", "a2a_roles", ["Retriever", "Scorer", "Summarizer", "Planner", "Other"])
-    if st.button("💡 Ask Assistant (Section 8)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_8")
-        if st.button("Get Answer", key="a_8"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_8"] = reply
-        if "llm_response_8" in st.session_state:
-            st.write(st.session_state["llm_response_8"])
-            if st.button("Insert into Section", key="i_8"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_8"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_8"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 9: External APIs & Secrets
-with st.expander("🔐 Section 9: External APIs & Secrets"):
-    section = "Section 9"
-    st.session_state.form_data.setdefault(section, {})
-    render_text_area(section, "External APIs", "external_apis", "List APIs called, authentication details")
-    render_text_area(section, "Secrets or API Keys", "secrets", "e.g., OPENAI_API_KEY")
-    render_text_area(section, "Timeout / Retry Logic", "timeouts", "Specify fallback or retry logic")
-    if st.button("💡 Ask Assistant (Section 9)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_9")
-        if st.button("Get Answer", key="a_9"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_9"] = reply
-        if "llm_response_9" in st.session_state:
-            st.write(st.session_state["llm_response_9"])
-            if st.button("Insert into Section", key="i_9"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_9"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_9"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 10: UI/UX & Branding
-with st.expander("🎨 Section 10: UI/UX & Branding"):
-    section = "Section 10"
-    st.session_state.form_data.setdefault(section, {})
-    render_checkbox(section, "Upload Logo?", "logo_upload")
-    render_checkbox(section, "Sidebar Navigation?", "use_sidebar")
-    render_checkbox(section, "Expandable Sections?", "use_expanders")
-    render_checkbox(section, "Custom Theme?", "custom_css")
-    render_text_area(section, "Describe Visual Journey", "visual_story", "What should user see first?")
-    if st.button("💡 Ask Assistant (Section 10)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_10")
-        if st.button("Get Answer", key="a_10"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_10"] = reply
-        if "llm_response_10" in st.session_state:
-            st.write(st.session_state["llm_response_10"])
-            if st.button("Insert into Section", key="i_10"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_10"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_10"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 11: README Metadata
-with st.expander("📄 Section 11: README Metadata"):
-    section = "Section 11"
-    st.session_state.form_data.setdefault(section, {})
-    render_text_area(section, "Use Case", "use_case", "When and why should this be used?")
-    render_text_area(section, "Limitations", "limitations", "What can it not do?")
-    render_text_area(section, "Evidence / Citations", "evidence", "PMIDs, guidelines, authors")
-    render_text_area(section, "Owner Insight", "insight", "Why did you build this?")
-    if st.button("💡 Ask Assistant (Section 11)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_11")
-        if st.button("Get Answer", key="a_11"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_11"] = reply
-        if "llm_response_11" in st.session_state:
-            st.write(st.session_state["llm_response_11"])
-            if st.button("Insert into Section", key="i_11"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_11"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_11"):
-            st.session_state["llm_section"] = None
-    
-
-# Section 12: Privacy & Compliance
-with st.expander("🛡 Section 12: Privacy & Compliance"):
-    section = "Section 12"
-    st.session_state.form_data.setdefault(section, {})
-    render_checkbox(section, "Handles PHI/PII?", "handles_phi")
-    render_checkbox(section, "De-identification Required?", "deid_needed")
-    render_multiselect(section, "Regulations", "regulations", ["HIPAA", "GDPR", "Other"])
-    render_text_area(section, "Privacy Handling", "privacy_controls", "How is data protected, logged, or restricted?")
-
-    if st.button("💡 Ask Assistant (Section 12)"):
-        st.session_state["llm_section"] = section
-    if st.session_state.get("llm_section") == section:
-        st.markdown("### 💬 Assistant")
-        user_question = st.text_area("Ask your question here", key="q_12")
-        if st.button("Get Answer", key="a_12"):
-            context = st.session_state.get("ref_doc", "")
-            prompt = f"You are helping a user complete the section '{section}' of a healthcare app intake form.\n\nReference:\n{context}\n\nUser question: {user_question}"
-            reply = ask_ollama(prompt)
-            st.session_state["llm_response_12"] = reply
-        if "llm_response_12" in st.session_state:
-            st.write(st.session_state["llm_response_12"])
-            if st.button("Insert into Section", key="i_12"):
-                current = st.session_state.form_data[section].get("llm_note", "")
-                st.session_state.form_data[section]["llm_note"] = current + "\n" + st.session_state["llm_response_12"]
-                st.success("✅ Inserted response into notes.")
-        if st.button("Close Assistant", key="c_12"):
-            st.session_state["llm_section"] = None
-    
+            render_assistant(section, n)
+    save_changes()
+    recorder.record("rerun", scope="section", section=section, seconds=time.perf_counter() - started)
+
+for n, spec in enumerate(FORM_SECTIONS, start=1):
+    with st.expander(spec["title"]):
+        render_section(spec, n)
+
+
+def deferred_export(fmt):
+    """
+    Returns a callable for st.download_button that renders the form when the
+    button is clicked. Edits made in section fragments since the last full
+    rerun are included, and formats nobody downloads are never built.
+    """
+    # The callable runs off the script thread, so capture the mutable state now.
+    form_data, form_version = st.session_state.form_data, st.session_state.form_version
+    return lambda: export(form_data, fmt, (form_version["token"], form_version["revision"]))
 
 # === Final Submission ===
 st.markdown("---")
 st.subheader("📝 Review & Export")
 if st.button("📤 Submit Form and Generate Markdown"):
-    markdown_output = "# 🧾 Completed Intake Form\n"
-    for section, fields in st.session_state.form_data.items():
-        markdown_output += f"\n## {section}\n"
-        for field, value in fields.items():
-            markdown_output += f"**{field.replace('_', ' ').title()}:**\n{value}\n\n"
-    st.download_button("📄 Download Markdown", data=markdown_output, file_name="intake_form.md")
-    st.markdown("### Preview:")
-    st.markdown(markdown_output)
+    st.session_state["export_ready"] = True
+if st.session_state.get("export_ready"):
+    download_labels = {"markdown": "📄 Download Markdown", "json": "🧾 Download JSON", "zip": "🗂 Download Bundle (.zip)"}
+    for column, (fmt, (_, file_name, mime)) in zip(st.columns(len(FORMATS)), FORMATS.items()):
+        with column:
+            st.download_button(download_labels[fmt], data=deferred_export(fmt),
+                               file_name=file_name, mime=mime, key=f"download_{fmt}")
+    if st.toggle("Show preview"):
+        st.markdown("### Preview:")
+        st.markdown(deferred_export("markdown")())
+
+save_changes()
+recorder.record("rerun", scope="app", session=st.session_state.session_id, seconds=time.perf_counter() - rerun_started)
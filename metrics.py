@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Optional sinks: a JSONL file of every event, and a Prometheus text endpoint.
+METRICS_PATH = os.environ.get("INTAKE_METRICS_PATH", "")
+METRICS_PORT = int(os.environ.get("INTAKE_METRICS_PORT", "0"))
+RECENT_EVENTS = int(os.environ.get("INTAKE_METRICS_RECENT", "200"))
+
+# metric name -> help text; every metric is exported as a counter.
+COUNTERS = {
+    "intake_rerun_seconds_total": "Wall time of full script reruns (scope=app) and section renders (scope=section).",
+    "intake_reruns_total": "Full script reruns (scope=app) and section renders (scope=section).",
+    "intake_llm_requests_total": "LLM calls by outcome.",
+    "intake_llm_request_seconds_total": "Wall time of LLM calls.",
+    "intake_llm_ttft_seconds_total": "Time to first token of streamed and cached LLM calls.",
+    "intake_llm_ttft_samples_total": "LLM calls with a time to first token.",
+    "intake_llm_prompt_chars_total": "Characters sent as prompt.",
+    "intake_llm_prompt_tokens_total": "Prompt tokens evaluated by Ollama (prompt_eval_count).",
+    "intake_llm_completion_tokens_total": "Tokens generated by Ollama (eval_count).",
+    "intake_llm_eval_seconds_total": "Generation time reported by Ollama (eval_duration).",
+    "intake_llm_retries_total": "HTTP retries against Ollama.",
+    "intake_llm_cache_total": "Response cache lookups by result.",
+}
+
+
+class MetricsRecorder:
+    """
+    Collects performance events, keeps the most recent ones for the debug
+    panel, aggregates them into Prometheus counters and optionally appends
+    each one to a JSONL file.
+    """
+
+    def __init__(self, path=METRICS_PATH, recent=RECENT_EVENTS):
+        self.path = path
+        self._recent = deque(maxlen=recent)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record(self, kind, **fields):
+        event = {"ts": round(time.time(), 3), "kind": kind, **fields}
+        with self._lock:
+            self._recent.append(event)
+            if kind == "rerun":
+                self._inc("intake_reruns_total", scope=fields["scope"])
+                self._inc("intake_rerun_seconds_total", fields["seconds"], scope=fields["scope"])
+            elif kind == "llm":
+                model = fields["model"]
+                self._inc("intake_llm_requests_total", model=model, outcome=fields["outcome"])
+                self._inc("intake_llm_request_seconds_total", fields["seconds"], model=model)
+                self._inc("intake_llm_prompt_chars_total", fields["prompt_chars"], model=model)
+                self._inc("intake_llm_cache_total", result=fields["cache"])
+                self._inc("intake_llm_retries_total", fields.get("retries", 0), model=model)
+                if fields.get("ttft") is not None:
+                    self._inc("intake_llm_ttft_seconds_total", fields["ttft"], model=model)
+                    self._inc("intake_llm_ttft_samples_total", model=model)
+                self._inc("intake_llm_prompt_tokens_total", fields.get("prompt_eval_count", 0), model=model)
+                self._inc("intake_llm_completion_tokens_total", fields.get("eval_count", 0), model=model)
+                self._inc("intake_llm_eval_seconds_total", fields.get("eval_duration", 0) / 1e9, model=model)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event) + "\n")
+
+    def recent(self, kind=None, limit=50):
+        with self._lock:
+            events = [e for e in self._recent if kind is None or e["kind"] == kind]
+        return events[-limit:]
+
+    def render_prometheus(self):
+        """
+        Returns the counters in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        lines = []
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+recorder = MetricsRecorder()
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve(port=METRICS_PORT):
+    """
+    Starts a background HTTP server exposing /metrics, once per process.
+    Does nothing when `port` is 0.
+    """
+    global _server
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+            threading.Thread(target=_server.serve_forever, name="intake-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from retrieval import build_index
+
+STORE_DIR = os.environ.get("INTAKE_REFDOC_DIR", ".cache/refdocs")
+MEMORY_BUDGET = int(float(os.environ.get("INTAKE_REFDOC_MEMORY_MB", "256")) * 1024 * 1024)
+
+def normalise(raw):
+    text = raw.decode("utf-8", errors="replace")
+    return text.removeprefix("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+
+
+class RefDoc:
+    """
+    One read-only reference document, shared by every session that uploads it.
+    """
+
+    def __init__(self, digest, path, text):
+        self.digest = digest
+        self.path = path
+        self.text = text
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        """
+        The BM25 index over the document's chunks, built on first use.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = build_index(self.text)
+            return self._index
+
+    @property
+    def nbytes(self):
+        """
+        Approximate resident size: the text plus, once built, the index with
+        its chunks and term statistics.
+        """
+        resident = sys.getsizeof(self.text)
+        if self._index is not None:
+            resident += self._index.nbytes
+        return resident
+
+
+class RefDocStore:
+    """
+    Content-addressed cache of uploaded reference documents. Each distinct
+    upload is decoded and normalised once, written to disk under its SHA-256
+    digest, and shared across sessions; sessions keep only the digest.
+    Documents are evicted from memory in LRU order once `memory_budget` is
+    exceeded and reloaded from disk on the next access.
+    """
+
+    def __init__(self, directory=STORE_DIR, memory_budget=MEMORY_BUDGET):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_budget = memory_budget
+        self.evictions = 0
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ingest(self, raw):
+        """
+        Stores the uploaded bytes if they are new and returns their digest.
+        """
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            if digest in self._docs:
+                self._docs.move_to_end(digest)
+                return digest
+
+        path = self.directory / f"{digest}.md"
+        text = normalise(raw)
+        if not path.exists():
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, path)
+        self._add(RefDoc(digest, path, text))
+        return digest
+
+    def get(self, digest):
+        """
+        Returns the RefDoc for `digest`, or None if it was never ingested.
+        """
+        if not digest:
+            return None
+        with self._lock:
+            doc = self._docs.get(digest)
+            if doc is not None:
+                self._docs.move_to_end(digest)
+                return doc
+
+        path = self.directory / f"{digest}.md"
+        if not path.exists():
+            return None
+        return self._add(RefDoc(digest, path, path.read_text(encoding="utf-8")))
+
+    def index(self, digest):
+        """
+        Returns the BM25 index for `digest`, or None if it was never ingested.
+        Building an index is what costs most memory, so the budget is
+        enforced again once it exists.
+        """
+        doc = self.get(digest)
+        if doc is None:
+            return None
+        index = doc.index
+        with self._lock:
+            self._evict()
+        return index
+
+    def _add(self, doc):
+        with self._lock:
+            existing = self._docs.get(doc.digest)
+            if existing is not None:
+                return existing
+            self._docs[doc.digest] = doc
+            self._evict()
+            return doc
+
+    def _evict(self):
+        # Never evict the most recently used document, however large it is.
+        while len(self._docs) > 1 and sum(doc.nbytes for doc in self._docs.values()) > self.memory_budget:
+            self._docs.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            return {
+                "documents": len(self._docs),
+                "resident_bytes": sum(doc.nbytes for doc in self._docs.values()),
+                "memory_budget": self.memory_budget,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,143 @@
+import math
+import re
+import sys
+from collections import Counter
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+FENCE_RE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how",
+    "i", "if", "in", "is", "it", "of", "on", "or", "should", "that", "the", "this", "to",
+    "what", "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def split_paragraph(paragraph, max_chars):
+    """
+    Yields pieces of at most `max_chars`: the paragraph itself if it fits,
+    otherwise its lines grouped together, with any overlong line cut into
+    fixed windows.
+    """
+    if len(paragraph) <= max_chars:
+        yield paragraph
+        return
+    current = ""
+    for line in paragraph.split("\n"):
+        if current and len(current) + len(line) + 1 > max_chars:
+            yield current
+            current = ""
+        while len(line) > max_chars:
+            yield line[:max_chars]
+            line = line[max_chars:]
+        current = f"{current}\n{line}" if current else line
+    if current:
+        yield current
+
+def chunk_markdown(text, max_chars=1500):
+    """
+    Splits a Markdown document into chunks at its headings. Each chunk is
+    prefixed with its heading path, and sections longer than `max_chars`
+    are split further on paragraph boundaries, then on line boundaries
+    within paragraphs that are themselves too long.
+    """
+    sections = []
+    path = []
+    lines = []
+    fence = None
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            sections.append((" > ".join(path), body))
+        lines.clear()
+
+    for line in text.splitlines():
+        # `#` lines inside fenced code blocks are comments, not headings.
+        opener = FENCE_RE.match(line)
+        if opener and fence is None:
+            fence = opener.group(1)
+        elif opener and opener.group(1)[0] == fence[0] and len(opener.group(1)) >= len(fence):
+            fence = None
+        match = HEADING_RE.match(line) if fence is None else None
+        if match:
+            flush()
+            level = len(match.group(1))
+            path[level - 1:] = [match.group(2).strip()]
+            continue
+        lines.append(line)
+    flush()
+
+    chunks = []
+    for heading, body in sections:
+        prefix = f"{heading}\n" if heading else ""
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", body):
+            for piece in split_paragraph(paragraph, max_chars):
+                if current and len(current) + len(piece) > max_chars:
+                    chunks.append(prefix + current.strip())
+                    current = ""
+                current += piece + "\n\n"
+        if current.strip():
+            chunks.append(prefix + current.strip())
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 lexical index over a list of text chunks.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._tf = [Counter(tokenize(chunk)) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_length = (sum(self._lengths) / len(chunks)) if chunks else 0
+        df = Counter(term for tf in self._tf for term in tf)
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+        self._nbytes = None
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory held by the index: the chunk strings plus the
+        per-chunk term counts and the idf table.
+        """
+        if self._nbytes is None:
+            size = sum(sys.getsizeof(chunk) for chunk in self.chunks)
+            for tf in self._tf:
+                # Per-entry cost of a term key and its small int count.
+                size += sys.getsizeof(tf) + sum(sys.getsizeof(term) + 28 for term in tf)
+            size += sys.getsizeof(self._idf) + sum(sys.getsizeof(term) + 24 for term in self._idf)
+            size += sys.getsizeof(self._tf) + sys.getsizeof(self._lengths) + 28 * len(self._lengths)
+            self._nbytes = size
+        return self._nbytes
+
+    def scores(self, query):
+        terms = [t for t in set(tokenize(query)) if t in self._idf]
+        scores = []
+        for tf, length in zip(self._tf, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            scores.append(sum(
+                self._idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+                for t in terms if t in tf
+            ))
+        return scores
+
+    def search(self, query, k=4):
+        """
+        Returns the `k` best-matching chunks in document order. Falls back to
+        the start of the document when nothing in the query matches.
+        """
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.chunks)), key=lambda i: scores[i], reverse=True)
+        top = [i for i in ranked[:k] if scores[i] > 0] or list(range(min(k, len(self.chunks))))
+        return [self.chunks[i] for i in sorted(top)]
+
+def build_index(text, max_chars=1500):
+    return BM25Index(chunk_markdown(text, max_chars))
@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+STORE_PATH = os.environ.get("INTAKE_SESSION_DB", ".cache/sessions.sqlite3")
+# Sessions not saved to for this long are deleted.
+RETENTION = float(os.environ.get("INTAKE_SESSION_RETENTION_DAYS", "30")) * 24 * 3600
+# How often save() prunes expired sessions.
+PRUNE_INTERVAL = 3600
+
+
+class SessionStore:
+    """
+    Field-level persistence for intake forms. Each changed field is one row,
+    so saving costs O(changed fields) and restoring a session is one query.
+    """
+
+    def __init__(self, path=STORE_PATH, retention=RETENTION):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.retention = retention
+        self._pruned_at = 0
+        with self._lock:
+            # WAL lets sessions autosave concurrently with restores.
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fields ("
+                "session_id TEXT NOT NULL, section TEXT NOT NULL, field TEXT NOT NULL, "
+                "value TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "UNIQUE (session_id, section, field))"
+            )
+            self._db.commit()
+        self.prune()
+
+    def prune(self):
+        """
+        Deletes every session whose last save is older than the retention period.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM fields WHERE session_id IN "
+                "(SELECT session_id FROM fields GROUP BY session_id HAVING MAX(updated_at) < ?)",
+                (now - self.retention,),
+            )
+        self._pruned_at = now
+
+    def save(self, session_id, changes):
+        """
+        Writes {(section, field): value} changes in a single transaction.
+        """
+        if not changes:
+            return
+        now = time.time()
+        rows = [(session_id, section, field, json.dumps(value), now) for (section, field), value in changes.items()]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO fields (session_id, section, field, value, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id, section, field) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                rows,
+            )
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def exists(self, session_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM fields WHERE session_id = ? LIMIT 1", (session_id,)).fetchone() is not None
+
+    def load(self, session_id):
+        """
+        Returns the saved form_data for `session_id`, in first-saved order.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT section, field, value FROM fields WHERE session_id = ? ORDER BY rowid",
+                (session_id,),
+            ).fetchall()
+        form_data = {}
+        for section, field, value in rows:
+            form_data.setdefault(section, {})[field] = json.loads(value)
+        return form_data